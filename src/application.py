@@ -89,6 +89,11 @@ def get_arguments() -> Namespace:
     parser.add_argument('-d', '--discard', dest="discard_packet", type=int, default=-1,
                         help="Packet seq number of the packet that should be discarded by server, "
                              "ignored by client. (default: -1)")
+    parser.add_argument('--fec', nargs=2, type=range_check_int(1, 65535), metavar=("N", "K"), default=None,
+                        help="Enables forward error correction on the client, sends K parity packets for every "
+                             "group of N data packets. N is reduced to the window if it is larger, the server "
+                             "accepts N up to its receiver window. "
+                             "Ignored by server. (default: disabled)")
     args = parser.parse_args()
 
     # Check for filename when running as a client
@@ -96,10 +101,16 @@ def get_arguments() -> Namespace:
         print("Argument Error: Must specify file name of file to be transferred with -f flag on client, exiting.\n")
         sys.exit(1)
 
+    # Check that there are not more parity packets than data packets per FEC group
+    if args.fec is not None and args.fec[1] > args.fec[0]:
+        print("Argument Error: K can't be larger than N in --fec, exiting.\n")
+        sys.exit(1)
+
     # Information message if arguments are ignored
     if args.server and args.file_name != "": print("Server doesnt use file name, ignoring.")
     if args.server and args.window != 3: print("Server doesnt use window argument, ignoring.")
     if args.client and args.discard_packet != -1: print("Client doesnt use discard argument, ignoring.")
+    if args.server and args.fec is not None: print("Server doesnt use FEC argument, ignoring.")
     print("")
     return args
 
@@ -112,7 +123,7 @@ def main() -> None:
     if args.server:
         Server(args.server_ip, args.server_port, args.discard_packet).run()
     elif args.client:
-        Client(args.server_ip, args.server_port, args.window, args.file_name).run()
+        Client(args.server_ip, args.server_port, args.window, args.file_name, args.fec).run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import argparse
+import os
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from math import ceil
+from statistics import median
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from time import perf_counter, process_time, sleep
+
+
+def run_transfer(source: str, server_port: int, window: int, file_name: str) -> tuple[float, float, int]:
+    """
+    Runs one transfer against a local server started in a separate process, so only the
+    client's CPU time is measured. Console output of both sides is discarded.
+    :param source: Directory with the application.py and client.py that should be benchmarked.
+    :param server_port: Port the local server should use.
+    :param window: Size of the sender window for the client.
+    :param file_name: Name of the file that should be transferred.
+    :return: Tuple with CPU time and wall time of the client's send_data in seconds, and the number of ACKs.
+    """
+    from client import Client       # Imported from the benchmarked source, see main
+    # The server writes the received file to its working directory
+    with TemporaryDirectory() as directory:
+        server = subprocess.Popen([sys.executable, os.path.join(source, "application.py"), "-s", "-p", str(server_port)],
+                                  cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            sleep(0.3)      # Gives the server time to bind
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                client = Client("127.0.0.1", server_port, window, file_name)
+                client.establish_connection()
+                cpu_start, wall_start = process_time(), perf_counter()
+                client.send_data()
+                cpu_time, wall_time = process_time() - cpu_start, perf_counter() - wall_start
+                client.close_connection()
+                client.file_handler.close_file()
+                client.socket.close()
+            server.wait(5)
+        finally:
+            server.kill()
+    return cpu_time, wall_time, ceil(os.path.getsize(file_name) / client.file_handler.segment_size)
+
+
+def main() -> None:
+    """
+    Benchmarks the CPU cost per ACK of the client's sender loop on a loss free local transfer.
+    With a baseline, benchmarks both versions, each in its own process, to compare their sender loops.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the client's CPU cost per ACK.")
+    parser.add_argument('-p', '--port', type=int, default=8098, help="Port for the local server. (default: 8098)")
+    parser.add_argument('-w', '--window', type=int, default=15, help="Size of the sender window. (default: 15)")
+    parser.add_argument('-s', '--size', type=int, default=2_000_000,
+                        help="Size of the transferred file in bytes. (default: 2000000)")
+    parser.add_argument('-r', '--runs', type=int, default=5, help="Number of transfers. (default: 5)")
+    parser.add_argument('-b', '--baseline', default=None,
+                        help="Directory with the application.py and client.py of another version to compare with, "
+                             "for example the src directory of an older checkout.")
+    parser.add_argument('--source', default=None,
+                        help="Directory with the application.py and client.py to benchmark, "
+                             "used internally. (default: directory of this script)")
+    args = parser.parse_args()
+    options: list[str] = ["-p", str(args.port), "-w", str(args.window), "-s", str(args.size), "-r", str(args.runs)]
+
+    # Runs each version in its own process, so the client and utils modules of the versions don't mix
+    if args.source is None:
+        versions: list[tuple[str, str]] = [("Current", os.path.dirname(os.path.abspath(__file__)))]
+        if args.baseline is not None:
+            versions.append(("Baseline", os.path.abspath(args.baseline)))
+        for name, source in versions:
+            print(f"{name} ({source}):")
+            sys.stdout.flush()
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--source", source, *options], check=True)
+        return
+
+    sys.path.insert(0, args.source)
+    cpu_times: list[float] = []
+    wall_times: list[float] = []
+    with NamedTemporaryFile(suffix=".jpg") as file:
+        file.write(os.urandom(args.size))
+        file.flush()
+        for _ in range(args.runs):
+            cpu_time, wall_time, acks = run_transfer(args.source, args.port, args.window, file.name)
+            cpu_times.append(cpu_time)
+            wall_times.append(wall_time)
+
+    print(f"{acks} ACKs per transfer, median of {args.runs} transfers:\n"
+          f"CPU time per ACK: {format(median(cpu_times) / acks * 1e6, ".1f")} us\n"
+          f"Wall time per ACK: {format(median(wall_times) / acks * 1e6, ".1f")} us")
+
+
+if __name__ == "__main__":
+    main()
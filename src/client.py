@@ -1,8 +1,70 @@
 import sys
+from selectors import DefaultSelector, EVENT_READ
 from socket import *
+from struct import pack
+from time import monotonic
 from utils import *
 
 
+class GoBackN:
+    """
+    Go-Back-N sending policy. Keeps track of the sliding window and decides which packets
+    can be sent when ACKs arrive and which are retransmitted when a timer expires.
+    """
+    def __init__(self, window_size: int, start_seq_num: int = 1):
+        """
+        Initialises the policy with the window size and the first sequence number.
+        :param window_size: The Maximum size of the sliding window.
+        :param start_seq_num: Sequence number of the first packet. Default is 1.
+        """
+        self.window_size: int = window_size
+        self.next_ack: int = start_seq_num
+        self.next_seq_num: int = start_seq_num
+        self.last_data_packet: int | float = float("inf")      # Temp value just so it compares true with an int
+        self.last_retrans_num: int = 0
+        self.retrans_attempts: int = 0
+
+    def sendable(self) -> range:
+        """
+        Finds the packets that fit in the window and have not been sent yet.
+        :return: Range with sequence numbers of the packets.
+        """
+        return range(self.next_seq_num, min(self.next_ack + self.window_size, self.last_data_packet + 1))
+
+    def on_ack(self, ack_num: int) -> bool:
+        """
+        Slides the window if the ACK is for the oldest packet in the window.
+        :param ack_num: The ACK number of the received ACK.
+        :return: True if the ACK was accepted.
+        """
+        if ack_num != self.next_ack or ack_num >= self.next_seq_num:
+            return False
+        self.next_ack += 1
+        return True
+
+    def on_timeout(self) -> range | None:
+        """
+        Finds the packets that should be retransmitted when a retransmission timer expires, the whole window.
+        Counts the retransmissions without any ACKs in between.
+        :return: Range with sequence numbers of the packets, None if there have been too many retransmissions.
+        """
+        if self.last_retrans_num == self.next_ack:
+            if self.retrans_attempts > 7:
+                return None
+            self.retrans_attempts += 1
+        else:
+            self.last_retrans_num = self.next_ack
+            self.retrans_attempts = 1
+        return range(self.next_ack, self.next_seq_num)
+
+    def is_done(self) -> bool:
+        """
+        Checks if the last data packet has been ACKed.
+        :return: True if the transfer is complete.
+        """
+        return self.next_ack > self.last_data_packet
+
+
 class Client:
     """
     Client for the DRTP protocol. Connects to the server and sends a file with Go-Back-N strategy.
@@ -10,8 +72,11 @@ class Client:
     """
     # Constants
     TIMEOUT = 0.4
+    TIMER_TICK = 0.01
+    ACK_BATCH = 64
 
-    def __init__(self, server_ip: str, server_port: int, sender_window: int, file_name: str):
+    def __init__(self, server_ip: str, server_port: int, sender_window: int, file_name: str,
+                 fec: tuple[int, int] | None = None):
         """
         Initialises the client. Connects to the server with the specified IP and port.
         Uses Go-Back-N strategy. Closes connection when the transfer is complete.
@@ -20,32 +85,67 @@ class Client:
         :param server_port: Port number on the server that the client should connect to.
         :param sender_window: The Maximum size of the sliding window the sender should send.
         :param file_name: Name of the file that should be transferred.
+        :param fec: Tuple with (N, K), sends K parity packets per group of N data packets if the
+               server accepts it in the handshake. FEC is disabled if not provided.
         """
         self.server_address: tuple[str, int] = (server_ip, server_port)
         self.socket = socket(AF_INET, SOCK_DGRAM)
         self.file_handler = FileHandler(file_name, 992)
         self.window_size: int = sender_window
+        self.fec_group_size, self.fec_parity_count = fec if fec is not None else (0, 0)
+        self.start_seq_num: int = 1
+        self.data_bytes_sent: int = 0       # Without retransmissions, so the FEC overhead compares with the server's
+        self.parity_bytes_sent: int = 0     # Without retransmissions, as data_bytes_sent
 
     def establish_connection(self) -> None:
         """
         Establishes connection with the server via sending an SYN. Then waiting for SYN-ACK to
         establish the connection and responding with ACK. Ignores wrong flags,
+        If a SYN with FEC request times out, sends a plain SYN once, servers without FEC ignore the request.
         Exits the client if an error is raised. Only returns on success.
         :param self: Variables of the object itself.
         """
         try:
             print("Connection Establishment Phase:\n")
-            self.socket.sendto(create_packet(0, 0, Flag.SYN, 0), self.server_address)
+            # Parity for a group larger than the window only arrives after the timeout, keeps groups inside the window
+            if self.fec_group_size > self.window_size:
+                print(f"FEC group size {self.fec_group_size} is larger than the window, using {self.window_size}")
+                self.fec_group_size = self.window_size
+                self.fec_parity_count = min(self.fec_parity_count, self.fec_group_size)
+            fec_request: tuple[int, int] = (self.fec_group_size, self.fec_parity_count)
+            if self.fec_parity_count:
+                self.socket.sendto(create_packet(0, 0, Flag.SYN | Flag.FEC, 0, pack("!HH", *fec_request)),
+                                   self.server_address)
+            else:
+                self.socket.sendto(create_packet(0, 0, Flag.SYN, 0), self.server_address)
             self.socket.settimeout(self.TIMEOUT)
             print("SYN packet is sent")
 
             # Waits for SYN | ACK ignores other packets
             while True:
-                packet = self.socket.recv(1000)
+                try:
+                    packet = self.socket.recv(1000)
+                except timeout:
+                    # Servers without FEC drop the SYN with FEC request, retries once with a plain SYN
+                    if not self.fec_parity_count:
+                        raise
+                    print("No SYN-ACK for the FEC request, sending SYN without FEC")
+                    self.fec_group_size, self.fec_parity_count = 0, 0
+                    self.socket.sendto(create_packet(0, 0, Flag.SYN, 0), self.server_address)
+                    print("SYN packet is sent")
+                    continue
                 _seq_num, _ack_num, flags, receiver_window, _data = parse_packet(packet)
 
-                if Flag.SYN | Flag.ACK == flags:
+                if flags in (Flag.SYN | Flag.ACK, Flag.SYN | Flag.ACK | Flag.FEC):
                     print("SYN-ACK packet is received")
+                    if fec_request[1] and not flags & Flag.FEC:
+                        print("Server did not accept FEC, continuing without FEC")
+                        self.fec_group_size, self.fec_parity_count = 0, 0
+                    elif flags & Flag.FEC:
+                        # A late SYN-ACK for the FEC request after the plain SYN still enables FEC
+                        self.fec_group_size, self.fec_parity_count = fec_request
+                        print(f"FEC enabled with {self.fec_parity_count} parity packets "
+                              f"per {self.fec_group_size} data packets")
                     self.socket.sendto(create_packet(0, 0, Flag.ACK, 0), self.server_address)
                     print("ACK packet is sent\n"
                           "Connection established\n")
@@ -55,6 +155,9 @@ class Client:
 
             # Chooses the smallest window size between the client and receiver.
             self.window_size = min(self.window_size, receiver_window)
+            if self.fec_group_size > self.window_size:
+                print("FEC group size is larger than the receiver window, continuing without FEC")
+                self.fec_group_size, self.fec_parity_count = 0, 0
         except timeout:
             print("\nError: Connection timed out while trying to establish connection")
             self.close_client(1)
@@ -65,82 +168,161 @@ class Client:
             print(f"\nUnexpected error: {e}")
             self.close_client(1)
 
-    def send_window(self, window: range, retransmission: bool = False) -> None:
+    def send_segment(self, seq_num: int, data: bytes, timers: TimerWheel) -> None:
+        """
+        Sends a data packet and starts its retransmission timer.
+        :param self: Variables of the object itself.
+        :param seq_num: Sequence number of the packet.
+        :param data: Data of the packet.
+        :param timers: Timer wheel holding the retransmission timers.
+        :raises ConnectionError: If the server refuses the packet.
+        """
+        packet = create_packet(seq_num, 0, 0, 0, data)
+        self.socket.sendto(packet, self.server_address)
+        timers.schedule(seq_num, monotonic() + self.TIMEOUT)
+
+    def send_new_packets(self, policy: GoBackN, timers: TimerWheel) -> None:
+        """
+        Sends the packets the sending policy allows that have not been sent yet. Finds the last data
+        packet when the file runs out and sends the parity packets of every FEC group that is completed.
+        :param self: Variables of the object itself.
+        :param policy: Sending policy of the transfer.
+        :param timers: Timer wheel holding the retransmission timers.
+        :raises ConnectionError: If the server refuses the packet.
+        """
+        for seq_num in policy.sendable():
+            data = self.file_handler.get_file_data(seq_num)
+            if data == b"":
+                policy.last_data_packet = seq_num - 1
+                # The last FEC group is cut short, its parity was not sent with the data.
+                if (self.fec_parity_count and policy.last_data_packet >= self.start_seq_num
+                        and not self.is_group_end(policy.last_data_packet)):
+                    self.send_parity(policy.last_data_packet)
+                return
+
+            self.send_segment(seq_num, data, timers)
+            self.data_bytes_sent += len(data) + 8     # Includes the header
+            policy.next_seq_num = seq_num + 1
+            print(f"{time_now_log()} packet with seq = {seq_num} is sent, sliding window = {list(range(policy.next_ack, seq_num + 1))}")
+
+            if self.fec_parity_count and self.is_group_end(seq_num):
+                self.send_parity(seq_num)
+
+    def send_window(self, window: range, timers: TimerWheel, last_data_packet: int | float = float("inf")) -> None:
         """
-        Sends all packets in the specified window. Can specify if its retransmission, makes a different console message.
+        Retransmits all packets in the specified window and restarts their retransmission timers.
+        Sends the parity packets of every FEC group the window completes.
         :param self: Variables of the object itself.
         :param window: Window of packets that should be sent. List with sequence numbers.
-        :param retransmission: Set True if it's a retransmission. Changes the console output.
+        :param timers: Timer wheel holding the retransmission timers.
+        :param last_data_packet: Sequence number of the last data packet, if known. Ends the last FEC group.
         :raises ConnectionError: If the server refuses the packet.
         """
-        if retransmission: tran_type: str = "retransmitted"
-        else:  tran_type: str = "sent"
         sent_window: list[int] = []
         for seq_num in window:
-            self.socket.sendto(create_packet(seq_num, 0, 0, 0, self.file_handler.get_file_data(seq_num)), self.server_address)
+            self.send_segment(seq_num, self.file_handler.get_file_data(seq_num), timers)
             sent_window.append(seq_num)
-            print(f"{time_now_log()} packet with seq = {seq_num} is {tran_type}, sliding window = {sent_window}")
+            print(f"{time_now_log()} packet with seq = {seq_num} is retransmitted, sliding window = {sent_window}")
+
+            if self.fec_parity_count and (self.is_group_end(seq_num) or seq_num == last_data_packet):
+                self.send_parity(seq_num, True)
+
+    def receive_acks(self, policy: GoBackN, timers: TimerWheel) -> None:
+        """
+        Receives and processes all ACKs waiting on the socket as one batch, up to ACK_BATCH packets.
+        Stops their retransmission timers. Ignores other packets.
+        :param self: Variables of the object itself.
+        :param policy: Sending policy of the transfer.
+        :param timers: Timer wheel holding the retransmission timers.
+        :raises ConnectionError: If the server refuses a packet.
+        """
+        for _ in range(self.ACK_BATCH):
+            try:
+                packet = self.socket.recv(1000)
+            except BlockingIOError:
+                return
+            _seq_num, ack_num, flags, _window, _data = parse_packet(packet)
+
+            if Flag.ACK == flags and policy.on_ack(ack_num):
+                print(f"{time_now_log()} ACK for packet = {ack_num} is received")
+                timers.cancel(ack_num)
+            else:
+                print(f"Received packet with wrong flag or wrong ack number received")
+
+    def is_group_end(self, seq_num: int) -> bool:
+        """
+        Checks if the sequence number is the last packet of a full FEC group.
+        :param self: Variables of the object itself.
+        :param seq_num: Sequence number of the data packet.
+        :return: True if the packet ends a FEC group.
+        """
+        return (seq_num - self.start_seq_num) % self.fec_group_size == self.fec_group_size - 1
+
+    def send_parity(self, last_seq_num: int, retransmission: bool = False) -> None:
+        """
+        Sends the parity packets for the FEC group ending with the specified packet.
+        The parity packets use the first sequence number of the group and the parity number as ACK number.
+        :param self: Variables of the object itself.
+        :param last_seq_num: Sequence number of the last data packet in the group.
+        :param retransmission: Set True if it's a retransmission. Not counted in the FEC overhead.
+        :raises ConnectionError: If the server refuses the packet.
+        """
+        group_start: int = last_seq_num - (last_seq_num - self.start_seq_num) % self.fec_group_size
+        segments: list[bytes] = [self.file_handler.get_file_data(seq_num)
+                                 for seq_num in range(group_start, last_seq_num + 1)]
+
+        if retransmission: tran_type: str = "retransmitted"
+        else:  tran_type: str = "sent"
+        for index, parity in enumerate(create_parity_data(segments, self.fec_parity_count)):
+            packet = create_packet(group_start, index, Flag.FEC, 0, parity)
+            self.socket.sendto(packet, self.server_address)
+            if not retransmission:
+                self.parity_bytes_sent += len(packet)
+            print(f"{time_now_log()} parity packet {index} for packets = {list(range(group_start, last_seq_num + 1))} is {tran_type}")
 
     def send_data(self, start_seq_num: int = 1) -> None:
         """
-        Sends the file to the receiver using the Go-Back-N strategy. Sends the whole window, then listens
-        for ACKs and sends the next packet in the window. If no ACKs arrive, retransmits the window.
+        Sends the file to the receiver using the Go-Back-N strategy. Runs an event loop on the non-blocking
+        socket: waits until ACKs arrive or the next retransmission timer expires, processes the waiting ACKs
+        as a batch and sends the packets the window allows. If a timer expires, retransmits the window.
         Ignores other packages. Exits if an error is raised.
         :param self: Variables of the object itself.
         :param start_seq_num: Sequence number that the transfer should start on. Default is 1.
         """
-        next_ack: int = start_seq_num
-        last_data_packet: int | float("inf") = float("inf")      # Temp value just so it compares true with an int
-        last_retrans_num: int = 0
-        retrans_attempts: int = 0
+        self.start_seq_num = start_seq_num
+        policy = GoBackN(self.window_size, start_seq_num)
+        timers = TimerWheel(self.TIMER_TICK, monotonic())
+        selector = DefaultSelector()
 
         try:
-            self.send_window(range(next_ack , next_ack + self.window_size))
+            self.socket.setblocking(False)
+            selector.register(self.socket, EVENT_READ)
+            self.send_new_packets(policy, timers)
 
-            #  Continue sending data packets per ACK until the last packet is ACKed.
-            while True:
-                try:
-                    packet = self.socket.recv(1000)
-                    _seq_num, ack_num, flags, _window, _data = parse_packet(packet)
-
-                    if Flag.ACK == flags and ack_num == next_ack:
-                        print(f"{time_now_log()} ACK for packet = {ack_num} is received")
-                        next_ack += 1
-                        next_seq_num = next_ack + self.window_size - 1
-                        data = b""
-
-                        # Check if the last data packet has been found.
-                        if last_data_packet == float('inf'):
-                            data = self.file_handler.get_file_data(next_seq_num)
-                            if data == b"":
-                                last_data_packet = next_seq_num - 1
-
-                        # Sends data if it's not after the last data packet.
-                        if next_seq_num <= last_data_packet:
-                            self.socket.sendto(create_packet(next_seq_num, 0, 0, 0, data), self.server_address)
-                            print(f"{time_now_log()} packet with seq = {next_seq_num} is sent, sliding window = {list(range(next_ack, min(next_ack + self.window_size, last_data_packet)))}")
-
-                        # Returns if the last data packet has been ACKed
-                        if next_ack > last_data_packet:
-                            self.file_handler.close_file()
-                            return
-                    else:
-                        print(f"Received packet with wrong flag or wrong ack number received")
-                except timeout:
-                    print(f"{time_now_log()} RTO occurred")
+            #  Continue until the last packet is ACKed.
+            while not policy.is_done():
+                next_deadline = timers.next_deadline()
+                if selector.select(None if next_deadline is None else max(next_deadline - monotonic(), 0)):
+                    self.receive_acks(policy, timers)
 
-                    # Counts and exits if too many retransmissions have happened > 5
-                    if last_retrans_num == next_ack:
-                        if retrans_attempts > 7:
-                            print("\nError: Too many retransmissions without any ACKs while trying to send data")
-                            self.close_client(1)
-                        retrans_attempts +=1
-                    else:
-                        last_retrans_num = next_ack
-                        retrans_attempts = 1
+                if timers.advance(monotonic()):
+                    print(f"{time_now_log()} RTO occurred")
+                    window = policy.on_timeout()
+                    if window is None:
+                        print("\nError: Too many retransmissions without any ACKs while trying to send data")
+                        self.close_client(1)
+                    self.send_window(window, timers, policy.last_data_packet)
 
-                    self.send_window(range(next_ack, min(next_ack + self.window_size, last_data_packet + 1)), True)
+                self.send_new_packets(policy, timers)
 
+            # The rest of the connection uses the blocking socket with timeout
+            selector.close()
+            self.socket.settimeout(self.TIMEOUT)
+            self.file_handler.close_file()
+            if self.fec_parity_count:
+                overhead = self.parity_bytes_sent / self.data_bytes_sent * 100 if self.data_bytes_sent else 0
+                print(f"\nFEC sent {self.parity_bytes_sent} parity bytes, "
+                      f"sent parity was {format(overhead, ".2f")} % of the data packets")
         except ConnectionError:
             print("\nError: Connection refused by server while trying to send data")
             self.close_client(1)
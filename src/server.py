@@ -1,6 +1,7 @@
 import sys
 from random import randint
 from socket import *
+from struct import unpack
 from time import time
 from utils import *
 
@@ -13,6 +14,7 @@ class Server:
     # Constants
     TIMEOUT: int = 2
     RECEIVER_WINDOW: int = 15
+    BUFFER_SIZE: int = 1004     # Largest packet is a parity packet, 8 header + 4 parity header + 992 data
 
     def __init__(self, server_ip: str, server_port: int, discard_packet: int):
         """
@@ -30,6 +32,14 @@ class Server:
         self.file_handler = FileHandler(f"received_img_{randint(1, 99999999)}.jpg")
         self.data_start_time: float | None = None
         self.cumulative_data: int = 0
+        self.fec_group_size: int = 0
+        self.fec_parity_count: int = 0
+        self.start_seq_num: int = 1
+        self.fec_segments: dict[int, bytes] = {}
+        self.fec_parities: dict[tuple[int, int], bytes] = {}
+        self.parity_data: int = 0      # Compared to cumulative_data, both without retransmissions
+        self.parities_received: set[tuple[int, int]] = set()
+        self.recovered_packets: int = 0
 
     def establish_connection(self) -> None:
         """
@@ -42,8 +52,8 @@ class Server:
             print("Ready to accept connection\n")
             # Waits for SYN packet, ignore others.
             while True:
-                packet, client_address = self.socket.recvfrom(1000)
-                _seq_num, _ack_num, flags, _window, _data = parse_packet(packet)
+                packet, client_address = self.socket.recvfrom(self.BUFFER_SIZE)
+                _seq_num, _ack_num, flags, _window, data = parse_packet(packet)
                 self.socket.settimeout(self.TIMEOUT)
 
                 if Flag.SYN == flags:
@@ -51,12 +61,28 @@ class Server:
                     self.socket.sendto(create_packet(0, 0, Flag.SYN | Flag.ACK, self.RECEIVER_WINDOW), client_address)
                     print("SYN-ACK packet is sent")
                     break
+                elif Flag.SYN | Flag.FEC == flags:
+                    # Accepts the FEC group size N and parity count K requested by the client if they are valid.
+                    # Groups must fit in the window, else the parity can't arrive before the timeout.
+                    # A request too short to hold N and K is invalid.
+                    print("SYN packet with FEC request is received")
+                    group_size, parity_count = unpack("!HH", data[:4]) if len(data) >= 4 else (0, 0)
+                    if 1 <= parity_count <= group_size <= self.RECEIVER_WINDOW:
+                        print(f"FEC request accepted, {parity_count} parity packets per {group_size} data packets")
+                        self.fec_group_size, self.fec_parity_count = group_size, parity_count
+                        self.socket.sendto(create_packet(0, 0, Flag.SYN | Flag.ACK | Flag.FEC, self.RECEIVER_WINDOW,
+                                                         data), client_address)
+                    else:
+                        print("Invalid FEC request, continuing without FEC")
+                        self.socket.sendto(create_packet(0, 0, Flag.SYN | Flag.ACK, self.RECEIVER_WINDOW), client_address)
+                    print("SYN-ACK packet is sent")
+                    break
                 else:
                     print("Received packet missing SYN flag while waiting to establish connection")
 
             # Waits for an ACK packet, ignores others.
             while True:
-                packet, client_address = self.socket.recvfrom(1000)
+                packet, client_address = self.socket.recvfrom(self.BUFFER_SIZE)
                 _seq_num, _ack_num, flags, _window, _data = parse_packet(packet)
 
                 if Flag.ACK == flags:
@@ -79,18 +105,20 @@ class Server:
         """
         Listens and accepts incoming data packets. Checks of they arrive in the correct order
         and respond with ACK if it does. Starts closing the connection when FIN packet is received.
-        Exits if an error is raised.
+        With FEC, out-of-order packets are kept and missing packets are rebuilt from parity packets
+        before they are treated as lost. Exits if an error is raised.
         :param self: Variables of the object itself.
         :param start_seq_num: Sequence number that the transfer should start on. Default is 1.
         """
+        self.start_seq_num = start_seq_num
         next_seq_num: int = start_seq_num
         self.data_start_time = time()   # For throughput calculation
 
         try:
             # Treats packets with no flags as a data packet. If a FIN flag is received, start closing the connection.
             while True:
-                packet, client_address = self.socket.recvfrom(1000)
-                seq_num, _ack_num, flags, _window, data = parse_packet(packet)
+                packet, client_address = self.socket.recvfrom(self.BUFFER_SIZE)
+                seq_num, ack_num, flags, _window, data = parse_packet(packet)
 
                 if flags == 0:
                     # Ignores the packet once if the sequence number matches the one that should be discarded
@@ -100,16 +128,26 @@ class Server:
 
                     # If it's the correct packet, write to the file and respond with ACK.
                     if seq_num == next_seq_num:
-                        self.cumulative_data += len(packet)     # For throughput calculation
-
                         print(f"{time_now_log()} packet = {seq_num} is received")
-                        self.file_handler.write_to_file(data)
+                        self.deliver_packet(seq_num, data, client_address)
                         next_seq_num += 1
-
-                        self.socket.sendto(create_packet(0, seq_num, Flag.ACK, 0), client_address)
-                        print(f"{time_now_log()} ACK for packet = {seq_num} sent")
                     else:
                         print(f"{time_now_log()} out-of-order packet {seq_num} is received")
+                        if self.fec_parity_count and seq_num > next_seq_num:
+                            self.fec_segments[seq_num] = data
+
+                    if self.fec_parity_count:
+                        next_seq_num = self.recover_packets(next_seq_num, client_address)
+
+                elif Flag.FEC == flags and self.fec_parity_count:
+                    # Parity packets use the first sequence number of the group and the parity number as ACK number
+                    print(f"{time_now_log()} parity packet {ack_num} for group starting at {seq_num} is received")
+                    if (seq_num, ack_num) not in self.parities_received:
+                        self.parities_received.add((seq_num, ack_num))
+                        self.parity_data += len(packet)
+                    if seq_num + self.fec_group_size > next_seq_num:
+                        self.fec_parities[(seq_num, ack_num)] = data
+                    next_seq_num = self.recover_packets(next_seq_num, client_address)
 
                 elif Flag.FIN == flags:
                     self.close_connection(client_address)
@@ -124,6 +162,76 @@ class Server:
             print(f"\nUnexpected error: {e}")
             self.exit_server(1)
 
+    def deliver_packet(self, seq_num: int, data: bytes, client_address: tuple[str, int]) -> None:
+        """
+        Writes the data of the next in-order packet to the file and responds with ACK.
+        Keeps the data while FEC is enabled so it can be used to rebuild other packets in its group.
+        :param self: Variables of the object itself.
+        :param seq_num: Sequence number of the packet.
+        :param data: Data of the packet.
+        :param client_address: IP address and port number of the client. Tuple with (ip, port).
+        :raises ConnectionError: If the client refuses the ACK.
+        """
+        self.cumulative_data += len(data) + 8    # For throughput calculation, includes the header
+        self.file_handler.write_to_file(data)
+        if self.fec_parity_count:
+            self.fec_segments[seq_num] = data
+
+        self.socket.sendto(create_packet(0, seq_num, Flag.ACK, 0), client_address)
+        print(f"{time_now_log()} ACK for packet = {seq_num} sent")
+
+    def rebuild_packet(self, seq_num: int) -> bytes | None:
+        """
+        Rebuilds a missing packet from the parity packet covering it and the other packets the parity covers.
+        :param self: Variables of the object itself.
+        :param seq_num: Sequence number of the missing packet.
+        :return: Data of the rebuilt packet, None if it can't be rebuilt yet.
+        """
+        group_start: int = seq_num - (seq_num - self.start_seq_num) % self.fec_group_size
+        index: int = (seq_num - group_start) % self.fec_parity_count
+        parity: bytes | None = self.fec_parities.get((group_start, index))
+        if parity is None:
+            return None
+
+        member_count, _length, _payload = parse_parity_data(parity)
+        covered: range = range(group_start + index, group_start + member_count, self.fec_parity_count)
+        if seq_num not in covered:
+            return None
+
+        segments: list[bytes | None] = [self.fec_segments.get(covered_seq) for covered_seq in covered
+                                        if covered_seq != seq_num]
+        if None in segments:
+            return None
+        return recover_segment(parity, segments)
+
+    def recover_packets(self, next_seq_num: int, client_address: tuple[str, int]) -> int:
+        """
+        Delivers kept out-of-order packets and packets rebuilt from parity for as long as the next
+        expected packet is available. Forgets packets and parities of groups that are completed.
+        :param self: Variables of the object itself.
+        :param next_seq_num: Sequence number of the next expected packet.
+        :param client_address: IP address and port number of the client. Tuple with (ip, port).
+        :return: Sequence number of the next expected packet after delivering.
+        :raises ConnectionError: If the client refuses the ACK.
+        """
+        while True:
+            if next_seq_num in self.fec_segments:
+                print(f"{time_now_log()} kept packet = {next_seq_num} is delivered")
+                data = self.fec_segments[next_seq_num]
+            else:
+                data = self.rebuild_packet(next_seq_num)
+                if data is None:
+                    break
+                self.recovered_packets += 1
+                print(f"{time_now_log()} packet = {next_seq_num} is recovered from parity")
+            self.deliver_packet(next_seq_num, data, client_address)
+            next_seq_num += 1
+
+        group_start: int = next_seq_num - (next_seq_num - self.start_seq_num) % self.fec_group_size
+        self.fec_segments = {seq_num: data for seq_num, data in self.fec_segments.items() if seq_num >= group_start}
+        self.fec_parities = {key: data for key, data in self.fec_parities.items() if key[0] >= group_start}
+        return next_seq_num
+
     def close_connection(self, client_address: tuple[str, int]) -> None:
         """
         Finishes closing the connection by responding with a FIN-ACK packet.
@@ -142,8 +250,12 @@ class Server:
             print(f"\nUnexpected error: {e}")
 
         throughput = (self.cumulative_data / (time() - self.data_start_time)) * 8 / 1e6
-        print(f"\nThe throughput was {format(throughput, ".2f")} Mbps\n"
-              "Connection Closed\n")
+        print(f"\nThe throughput was {format(throughput, ".2f")} Mbps")
+        if self.fec_parity_count:
+            overhead = self.parity_data / self.cumulative_data * 100 if self.cumulative_data else 0
+            print(f"FEC recovered {self.recovered_packets} packets, "
+                  f"received parity was {format(overhead, ".2f")} % of the data packets")
+        print("\nConnection Closed\n")
 
     def exit_server(self, exit_code: int = 0) -> None:
         """
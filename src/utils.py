@@ -1,18 +1,21 @@
 from datetime import datetime
 from enum import IntFlag
+from math import ceil
 from struct import pack, unpack, calcsize
 
 
 class Flag(IntFlag):
     """
     Flags for the header of the DRTP protocol
-    Reset, ACK, SYN, FIN
+    Reset, ACK, SYN, FIN, FEC
+    FEC on SYN and SYN-ACK negotiates forward error correction, on its own it marks a parity packet.
     Syntax for multiple flags: Flag.ACK | Flag.SYN
     """
     RESET = 1
     ACK = 2
     SYN = 4
     FIN = 8
+    FEC = 16
 
 
 class FileHandler:
@@ -74,6 +77,115 @@ class FileHandler:
             self.file = None
 
 
+class TimerWheel:
+    """
+    Hierarchical timer wheel for timers identified by a key, for example a sequence number.
+    Timers are kept in slots of one tick in the first wheel, timers further in the future are kept
+    in coarser wheels and moved down as the time passes. Scheduling and cancelling a timer is O(1).
+
+    Timers never expire before their deadline, but can expire up to one tick after it.
+    """
+    def __init__(self, tick: float, now: float, slots: int = 64, levels: int = 3):
+        """
+        Initialises the TimerWheel with the specified tick size and number of slots per wheel.
+        :param tick: Time of one tick in seconds. Deadlines are rounded up to a whole tick.
+        :param now: Current time in seconds, from the same clock as the deadlines.
+        :param slots: Number of slots in each wheel. (default 64)
+        :param levels: Number of wheels. Timers beyond the last wheel are moved down when it turns. (default 3)
+        """
+        self.tick: float = tick
+        self.slots: int = slots
+        self.wheels: list[list[dict]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.timers: dict = {}     # Key -> (deadline, slot), slot is the dict in the wheel holding the timer
+        self.current_tick: int = int(now / tick)     # Next tick that should be processed
+
+    def schedule(self, key, deadline: float) -> None:
+        """
+        Schedules a timer. Replaces the timer if one with the same key is already scheduled.
+        :param key: Key of the timer, returned when it expires.
+        :param deadline: Time the timer should expire in seconds.
+        """
+        self.cancel(key)
+        self._place(key, deadline)
+
+    def cancel(self, key) -> None:
+        """
+        Cancels a timer. Does nothing if no timer with the key is scheduled.
+        :param key: Key of the timer.
+        """
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            del timer[1][key]
+
+    def next_deadline(self) -> float | None:
+        """
+        Finds when the next timer expires, rounded up to a whole tick.
+        Looks through the scheduled timers, which is cheap for a window of timers.
+        :return: Time in seconds of the next expiry, None if no timers are scheduled.
+        """
+        if not self.timers:
+            return None
+        return ceil(min(deadline for deadline, _slot in self.timers.values()) / self.tick) * self.tick
+
+    def advance(self, now: float) -> list:
+        """
+        Advances the wheels to the current time and expires the timers that have passed their deadline.
+        :param now: Current time in seconds.
+        :return: List with the keys of the expired timers, ordered by deadline tick.
+        """
+        now_tick: int = int(now / self.tick)
+        if not self.timers:
+            self.current_tick = max(self.current_tick, now_tick + 1)
+            return []
+
+        expired: list = []
+        while self.current_tick <= now_tick and self.timers:
+            # Moves the timers of the coarser wheels down when the finer wheel has turned a whole round
+            level: int = 1
+            span: int = self.slots
+            while level < len(self.wheels) and self.current_tick % span == 0:
+                slot: dict = self.wheels[level][(self.current_tick // span) % self.slots]
+                for key, deadline in list(slot.items()):
+                    del slot[key]
+                    self._place(key, deadline)
+                level += 1
+                span *= self.slots
+
+            # Expires the timers of this tick, timers placed in the furthest slot are placed again
+            slot = self.wheels[0][self.current_tick % self.slots]
+            for key, deadline in list(slot.items()):
+                del slot[key]
+                if ceil(deadline / self.tick) > self.current_tick:
+                    self._place(key, deadline)
+                else:
+                    del self.timers[key]
+                    expired.append(key)
+            self.current_tick += 1
+
+        self.current_tick = max(self.current_tick, now_tick + 1)
+        return expired
+
+    def _place(self, key, deadline: float) -> None:
+        """
+        Places a timer in the finest wheel that reaches its deadline tick.
+        Timers with a passed deadline are placed in the next tick.
+        Timers beyond the coarsest wheel are placed in its furthest slot.
+        :param key: Key of the timer.
+        :param deadline: Time the timer should expire in seconds.
+        """
+        deadline_tick: int = max(ceil(deadline / self.tick), self.current_tick)
+        span: int = 1
+        for wheel in self.wheels:
+            if deadline_tick - self.current_tick < span * self.slots or wheel is self.wheels[-1]:
+                if deadline_tick - self.current_tick >= span * self.slots:
+                    deadline_tick = self.current_tick + span * (self.slots - 1)
+                slot: dict = wheel[(deadline_tick // span) % self.slots]
+                slot[key] = deadline
+                self.timers[key] = (deadline, slot)
+                return
+            span *= self.slots
+
+
 def create_packet(seq_num: int, ack_num: int, flags: int, window: int, data: bytes = None) -> bytes:
     """
     Creates a packet based on the input parameters.
@@ -105,6 +217,63 @@ def parse_packet(packet: bytes) -> tuple[int, int, int, int, bytes]:
     return *header_data, data
 
 
+def xor_segments(segments: list[bytes]) -> bytes:
+    """
+    XORs the segments together. Shorter segments are padded with zeros to the longest segment.
+    :param segments: The segments that should be XORed.
+    :return: The XORed bytes, same length as the longest segment.
+    """
+    size: int = max((len(segment) for segment in segments), default=0)
+    result: int = 0
+    for segment in segments:
+        result ^= int.from_bytes(segment.ljust(size, b"\0"), "big")
+    return result.to_bytes(size, "big")
+
+
+def create_parity_data(segments: list[bytes], parity_count: int) -> list[bytes]:
+    """
+    Creates the parity data for a FEC group. Parity number j covers every parity_count-th
+    segment starting at segment j, so the group can recover one lost segment per parity.
+    Each parity starts with a "!HH" header with the number of segments in the group
+    and the XOR of the lengths of the covered segments.
+    :param segments: Data of the segments in the group, in sequence order.
+    :param parity_count: Number of parities that should be created. At most one per segment.
+    :return: List with the data of the parity packets, ordered by parity number.
+    """
+    parities: list[bytes] = []
+    for index in range(min(parity_count, len(segments))):
+        covered: list[bytes] = segments[index::parity_count]
+        length: int = 0
+        for segment in covered:
+            length ^= len(segment)
+        parities.append(pack("!HH", len(segments), length) + xor_segments(covered))
+    return parities
+
+
+def parse_parity_data(parity: bytes) -> tuple[int, int, bytes]:
+    """
+    Parses the data of a parity packet.
+    :param parity: The data of the parity packet.
+    :return: Tuple with member_count, length, payload
+    """
+    header_format: str = "!HH"
+    header_size: int = calcsize(header_format)
+    return *unpack(header_format, parity[:header_size]), parity[header_size:]
+
+
+def recover_segment(parity: bytes, segments: list[bytes]) -> bytes:
+    """
+    Rebuilds the single missing segment covered by a parity.
+    :param parity: The data of the parity packet covering the missing segment.
+    :param segments: Data of the other segments covered by the parity.
+    :return: The data of the missing segment.
+    """
+    _member_count, length, payload = parse_parity_data(parity)
+    for segment in segments:
+        length ^= len(segment)
+    return xor_segments([payload, *segments])[:length]
+
+
 def time_now_log() -> str:
     """
     Creates a string with current time formatted as "HH:MM:SS.mmmmmm --"